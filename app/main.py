@@ -1,9 +1,24 @@
 """
 Main application file with API routes.
+
+Production launch mode (see Procfile / railway.json / gunicorn.conf.py):
+    gunicorn app.main:app
+Gunicorn preloads this module and forks one Uvicorn worker per CPU core
+(override with WEB_CONCURRENCY); the workers run on uvloop and httptools, the
+C implementations of the event loop and HTTP parser.
 """
+import logging
+import queue
+from contextlib import asynccontextmanager
+from logging.handlers import QueueHandler, QueueListener
 from fastapi import FastAPI, UploadFile, File, HTTPException, Header
+from fastapi.responses import ORJSONResponse
 from dotenv import load_dotenv
 from typing import Optional
+import numpy as np
+
+# Load environment variables from .env file (before the services read them at import)
+load_dotenv()
 
 from app.models import (
     ApiResponse,
@@ -12,15 +27,64 @@ from app.models import (
     SkinLesionResponseData
 )
 from app.services import get_skin_service, get_symptoms_service
+from app.services.doctormate_api_service import close_doctormate_client
+from app.services.symptoms_service import close_symptoms_service
 from app.utils import preprocess_image
 
-# Load environment variables from .env file
-load_dotenv()
+logger = logging.getLogger(__name__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Load and warm up models at startup; release shared clients on shutdown."""
+    # Log through a queue so request handlers never block on writes to stdout
+    log_queue = queue.SimpleQueue()
+    log_listener = QueueListener(log_queue, logging.StreamHandler())
+    # Attached explicitly (basicConfig is a no-op once root has a handler) and removed
+    # on shutdown, so a later lifespan in the same process logs to its own queue
+    log_handler = QueueHandler(log_queue)
+    log_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    root_logger = logging.getLogger()
+    root_logger.addHandler(log_handler)
+    root_logger.setLevel(logging.INFO)
+    # httpx/httpcore log every outbound Gemini and DoctorMate request at INFO
+    for name in ("httpx", "httpcore"):
+        logging.getLogger(name).setLevel(logging.WARNING)
+    log_listener.start()
+    
+    # Load the ONNX model and run it twice so the first real request doesn't pay
+    # for graph loading, kernel selection and thread-pool spin-up
+    skin_service = get_skin_service()
+    warmup_input = {skin_service.input_name: np.zeros((1, 224, 224, 3), dtype=skin_service.input_dtype)}
+    for _ in range(2):
+        skin_service.session.run(None, warmup_input)
+    
+    # Validate symptom service configuration eagerly; a missing key is reported per request
+    try:
+        get_symptoms_service()
+    except ValueError as e:
+        logger.warning("Symptom analysis unavailable: %s", e)
+    
+    try:
+        yield
+    finally:
+        # Nested so a failing close never skips the rest, and the log listener
+        # always stops and flushes queued records
+        try:
+            try:
+                await close_doctormate_client()
+            finally:
+                await close_symptoms_service()
+        finally:
+            root_logger.removeHandler(log_handler)
+            log_listener.stop()
+
 
 app = FastAPI(
     title="DoctorMate AI",
     description="AI-powered medical assistant for skin lesion and symptom analysis",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
 )
 
 
@@ -50,8 +114,10 @@ async def skin_check(
         ApiResponse with skin lesion analysis results
     """
     try:
-        # Preprocess image
-        image_array = await preprocess_image(file)
+        skin_service = get_skin_service()
+        
+        # Preprocess image in the precision the model expects
+        image_array = await preprocess_image(file, dtype=skin_service.input_dtype)
         
         # Extract token from Authorization header
         token = None
@@ -59,7 +125,6 @@ async def skin_check(
             token = authorization.replace("Bearer ", "")
         
         # Get prediction from service (now async)
-        skin_service = get_skin_service()
         prediction = await skin_service.predict(image_array, token)
         
         return ApiResponse(
@@ -67,6 +132,8 @@ async def skin_check(
             message="Skin lesion analysis completed successfully",
             data=prediction
         )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
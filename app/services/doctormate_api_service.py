@@ -2,39 +2,131 @@
 Service for interacting with DoctorMate external API.
 """
 import os
+import sys
+import asyncio
+import hashlib
+import logging
+import threading
+import time
 import httpx
-from typing import List, Dict, Optional
+from cachetools import TTLCache
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_exponential
+from typing import List, Dict, Optional, Tuple
 from enum import Enum
 
+logger = logging.getLogger(__name__)
+
+# Doctor lookups are near-static, so cache them per token for a few minutes
+_cache = TTLCache(maxsize=512, ttl=300)
+# The specialty list is the same for every caller, so it is cached once for all tokens
+_specialties_cache = TTLCache(maxsize=1, ttl=600)
+_cache_lock = asyncio.Lock()
+
+
+def _hash_token(token: str) -> str:
+    """Hash a bearer token so raw credentials are never used as cache keys."""
+    return hashlib.blake2b(token.encode("utf-8"), digest_size=16).hexdigest()
+
+
+async def _cache_get(key, cache: TTLCache = _cache):
+    """Return a cached value or None if missing/expired."""
+    async with _cache_lock:
+        return cache.get(key)
+
+
+async def _cache_set(key, value, cache: TTLCache = _cache) -> None:
+    """Store a value in a TTL cache."""
+    async with _cache_lock:
+        cache[key] = value
+
+
+# Shared HTTP client so DoctorMate calls reuse pooled keep-alive connections
+_client: Optional[httpx.AsyncClient] = None
+_client_lock = threading.Lock()
+
+
+class CircuitBreaker:
+    """Stops calling a failing downstream service until a cool-down period has passed."""
+    
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        """Initialize the breaker.
+        
+        Args:
+            failure_threshold: Consecutive failures before the circuit opens
+            reset_timeout: Seconds to wait before letting a trial request through
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+    
+    def allow_request(self) -> bool:
+        """Return True if a request may be sent to the downstream service."""
+        if self._opened_at is None:
+            return True
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            # Half-open: allow one trial request per cool-down window
+            self._opened_at = time.monotonic()
+            return True
+        return False
+    
+    def record_success(self) -> None:
+        """Close the circuit after a successful call."""
+        self._failures = 0
+        self._opened_at = None
+    
+    def record_failure(self) -> None:
+        """Count a failed call, opening the circuit once the threshold is reached."""
+        self._failures += 1
+        if self._failures >= self.failure_threshold:
+            self._opened_at = time.monotonic()
+
+
+_breaker = CircuitBreaker()
+
 
 class SpecialtyMapper:
     """Maps medical conditions to specialty IDs."""
     
+    # Specialty IDs (interned so every mapping shares a single string object)
+    CARDIOLOGY_ID = sys.intern("a1111111-a1a1-a1a1-a1a1-a1a1a1a1a1a1")
+    NEUROLOGY_ID = sys.intern("5b05c49a-288f-48f3-b684-6d505c58d276")
+    DERMATOLOGY_ID = sys.intern("b2222222-b2b2-b2b2-b2b2-b2b2b2b2b2b2")
+    PEDIATRICS_ID = sys.intern("bb79c512-c722-4e5a-a1fc-c9699359b636")
+    GENERAL_ID = sys.intern("fa12fdd9-0a6a-4330-814c-17fd31fbd637")
+    
     # Skin lesion to specialty mapping
     SKIN_LESION_MAP = {
-        "mel": "b2222222-b2b2-b2b2-b2b2-b2b2b2b2b2b2",  # Dermatology - Melanoma
-        "bcc": "b2222222-b2b2-b2b2-b2b2-b2b2b2b2b2b2",  # Dermatology - Basal cell carcinoma
-        "akiec": "b2222222-b2b2-b2b2-b2b2-b2b2b2b2b2b2",  # Dermatology - Actinic keratoses
-        "bkl": "b2222222-b2b2-b2b2-b2b2-b2b2b2b2b2b2",  # Dermatology - Benign keratosis
-        "df": "b2222222-b2b2-b2b2-b2b2-b2b2b2b2b2b2",  # Dermatology - Dermatofibroma
-        "nv": "b2222222-b2b2-b2b2-b2b2-b2b2b2b2b2b2",  # Dermatology - Melanocytic nevi
-        "vasc": "b2222222-b2b2-b2b2-b2b2-b2b2b2b2b2b2",  # Dermatology - Vascular lesions
+        "mel": DERMATOLOGY_ID,  # Dermatology - Melanoma
+        "bcc": DERMATOLOGY_ID,  # Dermatology - Basal cell carcinoma
+        "akiec": DERMATOLOGY_ID,  # Dermatology - Actinic keratoses
+        "bkl": DERMATOLOGY_ID,  # Dermatology - Benign keratosis
+        "df": DERMATOLOGY_ID,  # Dermatology - Dermatofibroma
+        "nv": DERMATOLOGY_ID,  # Dermatology - Melanocytic nevi
+        "vasc": DERMATOLOGY_ID,  # Dermatology - Vascular lesions
     }
     
     # Symptom keywords to specialty mapping
     SYMPTOM_KEYWORDS_MAP = {
-        "heart|chest pain|palpitation|cardiac": "a1111111-a1a1-a1a1-a1a1-a1a1a1a1a1a1",  # Cardiology
-        "brain|headache|seizure|neurological|nerve": "5b05c49a-288f-48f3-b684-6d505c58d276",  # Neurology
-        "skin|rash|acne|eczema|dermatological": "b2222222-b2b2-b2b2-b2b2-b2b2b2b2b2b2",  # Dermatology
-        "child|infant|pediatric|baby": "bb79c512-c722-4e5a-a1fc-c9699359b636",  # Pediatrics
+        "heart|chest pain|palpitation|cardiac": CARDIOLOGY_ID,  # Cardiology
+        "brain|headache|seizure|neurological|nerve": NEUROLOGY_ID,  # Neurology
+        "skin|rash|acne|eczema|dermatological": DERMATOLOGY_ID,  # Dermatology
+        "child|infant|pediatric|baby": PEDIATRICS_ID,  # Pediatrics
     }
     
+    # (keyword, specialty ID) pairs split once at class load, in map priority order
+    _FLAT_KEYWORDS = tuple(
+        (keyword, specialty_id)
+        for keywords, specialty_id in SYMPTOM_KEYWORDS_MAP.items()
+        for keyword in keywords.split("|")
+    )
+    
     @staticmethod
     def get_specialty_for_skin_lesion(diagnosis_code: str) -> str:
         """Get specialty ID for skin lesion diagnosis."""
         return SpecialtyMapper.SKIN_LESION_MAP.get(
             diagnosis_code,
-            "b2222222-b2b2-b2b2-b2b2-b2b2b2b2b2b2"  # Default to Dermatology
+            SpecialtyMapper.DERMATOLOGY_ID  # Default to Dermatology
         )
     
     @staticmethod
@@ -44,19 +136,20 @@ class SpecialtyMapper:
         diagnosis_lower = diagnosis.lower()
         combined = f"{symptoms_lower} {diagnosis_lower}"
         
-        for keywords, specialty_id in SpecialtyMapper.SYMPTOM_KEYWORDS_MAP.items():
-            for keyword in keywords.split("|"):
-                if keyword in combined:
-                    return specialty_id
+        for keyword, specialty_id in SpecialtyMapper._FLAT_KEYWORDS:
+            if keyword in combined:
+                return specialty_id
         
         # Default to general specialty if no match
-        return "fa12fdd9-0a6a-4330-814c-17fd31fbd637"
+        return SpecialtyMapper.GENERAL_ID
 
 
 class DoctorMateAPIService:
     """Service for fetching specialties and doctors from DoctorMate API."""
     
     BASE_URL = "https://doctormate.runasp.net/api"
+    # Fail fast so a slow DoctorMate never holds a response for long
+    TIMEOUT = httpx.Timeout(3.0, connect=1.0)
     
     def __init__(self, token: str):
         """Initialize the service with API token.
@@ -65,11 +158,48 @@ class DoctorMateAPIService:
             token: Bearer token for DoctorMate API authentication
         """
         self.token = token
+        self.token_hash = _hash_token(token)
         self.headers = {
             "Authorization": f"Bearer {self.token}",
             "Content-Type": "application/json"
         }
     
+    async def _get(self, path: str, params: Optional[Dict] = None) -> Optional[httpx.Response]:
+        """
+        Send a GET request to the DoctorMate API through the circuit breaker.
+        
+        Args:
+            path: API path relative to BASE_URL
+            params: Optional query parameters
+            
+        Returns:
+            The response, or None without touching the network while the circuit is open
+        """
+        if not _breaker.allow_request():
+            return None
+        
+        try:
+            response = await self._get_with_retry(path, params)
+        except httpx.TransportError:
+            _breaker.record_failure()
+            raise
+        
+        if response.status_code >= 500:
+            _breaker.record_failure()
+        else:
+            _breaker.record_success()
+        return response
+    
+    @retry(
+        stop=stop_after_attempt(2),
+        wait=wait_exponential(multiplier=0.1, max=0.5),
+        retry=retry_if_exception_type(httpx.TransportError),
+        reraise=True
+    )
+    async def _get_with_retry(self, path: str, params: Optional[Dict] = None) -> httpx.Response:
+        """GET with one retry on connection-level errors (never on HTTP error statuses)."""
+        return await _get_client().get(path, headers=self.headers, params=params)
+    
     async def get_specialty(self, specialty_id: str) -> Optional[Dict]:
         """
         Get specialty details by ID.
@@ -80,31 +210,39 @@ class DoctorMateAPIService:
         Returns:
             Specialty information or None if not found
         """
+        specialties = await self._get_specialties()
+        return specialties.get(specialty_id) if specialties else None
+    
+    async def _get_specialties(self) -> Optional[Dict[str, Dict]]:
+        """Fetch all specialties indexed by ID, served from cache when available."""
+        key = "specialties"
+        specialties = await _cache_get(key, _specialties_cache)
+        if specialties is not None:
+            return specialties
+        
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                response = await client.get(
-                    f"{self.BASE_URL}/Specialties",
-                    headers=self.headers
-                )
-                
-                if response.status_code == 200:
-                    data = response.json()
-                    specialties = data.get("data", [])
-                    
-                    # Find the specialty by ID
-                    for specialty in specialties:
-                        if specialty.get("id") == specialty_id:
-                            return {
-                                "id": specialty.get("id"),
-                                "name": specialty.get("name"),
-                                "description": specialty.get("description"),
-                                "imageUrl": specialty.get("imageUrl")
-                            }
+            response = await self._get("/Specialties")
+            
+            if response is None or response.status_code != 200:
                 return None
-                
-        except Exception as e:
-            print(f"Error fetching specialty: {str(e)}")
+            
+            data = response.json()
+            specialties = {
+                specialty.get("id"): {
+                    "id": specialty.get("id"),
+                    "name": specialty.get("name"),
+                    "description": specialty.get("description"),
+                    "imageUrl": specialty.get("imageUrl")
+                }
+                for specialty in data.get("data", [])
+            }
+            
+        except Exception:
+            logger.exception("Error fetching specialty")
             return None
+        
+        await _cache_set(key, specialties, _specialties_cache)
+        return specialties
     
     async def get_recommended_doctors(
         self, 
@@ -121,37 +259,95 @@ class DoctorMateAPIService:
         Returns:
             List of recommended doctors
         """
+        key = ("doctors", self.token_hash, specialty_id, limit)
+        doctors = await _cache_get(key)
+        if doctors is not None:
+            return doctors
+        
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                response = await client.get(
-                    f"{self.BASE_URL}/Specialties/{specialty_id}/doctors",
-                    headers=self.headers,
-                    params={"page": 1, "limit": limit}
-                )
+            response = await self._get(
+                f"/Specialties/{specialty_id}/doctors",
+                params={"page": 1, "limit": limit}
+            )
+            
+            if response is not None and response.status_code == 200:
+                data = response.json()
+                doctors = data.get("data", {}).get("doctors", [])
                 
-                if response.status_code == 200:
-                    data = response.json()
-                    doctors = data.get("data", {}).get("doctors", [])
-                    
-                    # Format doctor information
-                    return [
-                        {
-                            "id": doctor.get("id"),
-                            "fullName": doctor.get("fullName"),
-                            "imageUrl": doctor.get("imageUrl"),
-                            "consultationFee": doctor.get("consultationFee"),
-                            "address": doctor.get("address"),
-                            "workingTime": doctor.get("workingTime"),
-                            "qualifications": doctor.get("qualifications"),
-                        }
-                        for doctor in doctors[:limit]
-                    ]
-                    
-                return []
+                # Format doctor information
+                doctors = [
+                    {
+                        "id": doctor.get("id"),
+                        "fullName": doctor.get("fullName"),
+                        "imageUrl": doctor.get("imageUrl"),
+                        "consultationFee": doctor.get("consultationFee"),
+                        "address": doctor.get("address"),
+                        "workingTime": doctor.get("workingTime"),
+                        "qualifications": doctor.get("qualifications"),
+                    }
+                    for doctor in doctors[:limit]
+                ]
+                await _cache_set(key, doctors)
+                return doctors
                 
-        except Exception as e:
-            print(f"Error fetching doctors: {str(e)}")
             return []
+            
+        except Exception:
+            logger.exception("Error fetching doctors")
+            return []
+    
+    async def get_specialty_and_doctors(
+        self,
+        specialty_id: str,
+        limit: int = 3
+    ) -> Tuple[Dict, List[Dict]]:
+        """
+        Fetch specialty details and recommended doctors concurrently.
+        
+        Args:
+            specialty_id: Specialty UUID
+            limit: Maximum number of doctors to return
+            
+        Returns:
+            Tuple of (specialty, recommended doctors), falling back to {} / [] on failure
+        """
+        specialty, doctors = await asyncio.gather(
+            self.get_specialty(specialty_id),
+            self.get_recommended_doctors(specialty_id, limit=limit),
+            return_exceptions=True
+        )
+        
+        if isinstance(specialty, BaseException):
+            logger.error("Error fetching specialty", exc_info=specialty)
+            specialty = None
+        if isinstance(doctors, BaseException):
+            logger.error("Error fetching doctors", exc_info=doctors)
+            doctors = []
+        
+        return specialty or {}, doctors
+
+
+def _get_client() -> httpx.AsyncClient:
+    """Get the shared DoctorMate HTTP client, creating it on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = httpx.AsyncClient(
+                    base_url=DoctorMateAPIService.BASE_URL,
+                    timeout=DoctorMateAPIService.TIMEOUT,
+                    limits=httpx.Limits(max_keepalive_connections=32, max_connections=64),
+                    http2=True
+                )
+    return _client
+
+
+async def close_doctormate_client() -> None:
+    """Close the shared DoctorMate HTTP client (called on application shutdown)."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
 
 
 def get_doctormate_api_service(token: str) -> DoctorMateAPIService:
@@ -163,4 +359,5 @@ def get_doctormate_api_service(token: str) -> DoctorMateAPIService:
     Returns:
         DoctorMateAPIService instance
     """
+    _get_client()
     return DoctorMateAPIService(token)
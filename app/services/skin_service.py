@@ -1,15 +1,34 @@
 """
 Service layer for skin lesion analysis.
 """
+import asyncio
+import logging
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import onnxruntime as ort
 import numpy as np
-import json
+import orjson
 from pathlib import Path
 from typing import Dict
 from app.services.doctormate_api_service import (
     get_doctormate_api_service,
     SpecialtyMapper
 )
+from app.utils import aligned_empty
+
+logger = logging.getLogger(__name__)
+
+# Micro-batching limits: flush a batch once it is full or the oldest request waited this long
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "8"))
+MAX_WAIT_MS = float(os.getenv("MAX_WAIT_MS", "15"))
+# Batch input buffers kept for reuse; each holds MAX_BATCH_SIZE images (~4.8 MB at float32)
+BATCH_BUFFER_POOL_SIZE = int(os.getenv("BATCH_BUFFER_POOL_SIZE", "2"))
+
+# Knowledge base is read-only, so load it once per process (shared copy-on-write after fork)
+_KB_PATH = Path(__file__).parent / "skin_rules.json"
+_KNOWLEDGE_BASE = orjson.loads(_KB_PATH.read_bytes())
 
 
 class SkinAnalysisService:
@@ -17,21 +36,122 @@ class SkinAnalysisService:
     
     # Class constants
     CLASS_NAMES = ["akiec", "bcc", "bkl", "df", "mel", "nv", "vasc"]
+    MODEL_PATH = "models/MobileNetV2_best.onnx"
+    INT8_MODEL_PATH = "models/MobileNetV2_best_int8.onnx"
     
-    def __init__(self, model_path: str = "models/MobileNetV2_best.onnx"):
+    def __init__(self, model_path: str = None):
         """Initialize the service with ONNX model and knowledge base."""
+        # Prefer the int8-quantized model when it has been generated
+        if model_path is None:
+            model_path = self.INT8_MODEL_PATH if Path(self.INT8_MODEL_PATH).exists() else self.MODEL_PATH
         self.model_path = model_path
-        self.session = ort.InferenceSession(self.model_path)
         
-        # Load knowledge base
-        knowledge_base_path = Path(__file__).parent / "skin_rules.json"
-        with open(knowledge_base_path, 'r', encoding='utf-8') as f:
-            self.knowledge_base = json.load(f)
+        # Parallelism comes from the executor threads, so keep each inference single-threaded
+        sess_options = ort.SessionOptions()
+        sess_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        sess_options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        sess_options.intra_op_num_threads = 1
+        # Reuse planned buffers without a large per-process arena (one per worker adds up)
+        sess_options.enable_mem_pattern = True
+        sess_options.enable_cpu_mem_arena = False
+        self.session = ort.InferenceSession(
+            self.model_path,
+            sess_options,
+            providers=["CPUExecutionProvider"]
+        )
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        # Precision the model expects, so preprocessing can emit it directly
+        self.input_dtype = np.float16 if model_input.type == "tensor(float16)" else np.float32
+        
+        self.knowledge_base = _KNOWLEDGE_BASE
+        
+        # Micro-batching queue of (image, future) pairs, drained by a background task
+        self._queue = None
+        self._batch_task = None
+        self._inflight = set()
+        
+        # Inference runs on worker threads so it never blocks the event loop
+        self._executor = ThreadPoolExecutor(max_workers=os.cpu_count())
+        # Batch input buffers shared by the executor threads; the maxlen bounds how many
+        # are kept, so spare buffers are freed instead of pinned to every thread
+        self._batch_buffers = deque(maxlen=BATCH_BUFFER_POOL_SIZE)
+    
+    def start_batcher(self) -> None:
+        """Start the background batching task on the running event loop (no-op if already running)."""
+        if self._batch_task is not None and not self._batch_task.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # No event loop yet; the batcher is started on the first request
+            return
+        self._queue = asyncio.Queue()
+        self._batch_task = loop.create_task(self._batch_loop())
+    
+    async def _batch_loop(self) -> None:
+        """Collect queued images into batches and dispatch each batch for inference."""
+        loop = asyncio.get_running_loop()
+        while True:
+            items = [await self._queue.get()]
+            deadline = loop.time() + MAX_WAIT_MS / 1000
+            
+            while len(items) < MAX_BATCH_SIZE:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    items.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            
+            # Keep collecting the next batch while this one runs on the executor
+            task = loop.create_task(self._run_batch(items))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+    
+    async def _run_batch(self, items: list) -> None:
+        """Run one batch through the model off the event loop and resolve its futures."""
+        try:
+            probs_batch = await asyncio.get_running_loop().run_in_executor(
+                self._executor, self._infer_batch, [image for image, _ in items]
+            )
+        except Exception as e:
+            for _, future in items:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        
+        for i, (_, future) in enumerate(items):
+            # Skip requests that were cancelled while waiting
+            if not future.done():
+                future.set_result((probs_batch, i))
         
+    def _infer_batch(self, images: list) -> np.ndarray:
+        """Stack images into a pooled input buffer and run the model (executor thread)."""
+        # deque pop/append are atomic, so a buffer is only ever held by one thread
+        try:
+            buffer = self._batch_buffers.pop()
+        except IndexError:
+            buffer = None
+        if buffer is None or buffer.shape[1:] != images[0].shape or buffer.dtype != images[0].dtype:
+            buffer = aligned_empty((MAX_BATCH_SIZE, *images[0].shape), dtype=images[0].dtype)
+        
+        batch = buffer[:len(images)]
+        np.stack(images, axis=0, out=batch)
+        try:
+            return self.session.run(None, {self.input_name: batch})[0]
+        finally:
+            # The buffer is free again once session.run returns
+            self._batch_buffers.append(buffer)
+    
     async def predict(self, image_array: np.ndarray, token: str = None) -> dict:
         """
         Predict skin lesion type from preprocessed image array.
         
+        The image is queued and run together with other concurrent requests
+        in a single batched inference call.
+        
         Args:
             image_array: Preprocessed image array in NHWC format
             token: Optional DoctorMate API bearer token for fetching specialty/doctors
@@ -39,22 +159,27 @@ class SkinAnalysisService:
         Returns:
             dict: Prediction results with diagnosis, confidence, severity, etc.
         """
-        # Run inference
-        inputs = {self.session.get_inputs()[0].name: image_array}
-        outputs = self.session.run(None, inputs)
-        predictions = outputs[0]
+        self.start_batcher()
+        
+        # Queue the image (without its batch dimension) and wait for the batch output
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((image_array[0], future))
+        probs_batch, row = await future
         
         # Format response
-        return await self._format_prediction(predictions, token)
+        return await self._format_prediction(probs_batch, row, token)
     
-    async def _format_prediction(self, predictions: np.ndarray, token: str = None) -> dict:
-        """Format raw model predictions into structured response with knowledge base."""
-        probs = predictions[0]
-        idx = int(np.argmax(probs))
+    async def _format_prediction(self, probs_batch: np.ndarray, row: int, token: str = None) -> dict:
+        """Format one row of batched model predictions into structured response with knowledge base."""
+        probs = probs_batch[row]
+        idx = int(probs.argmax())
         
         diagnosis = self.CLASS_NAMES[idx]
         confidence = float(probs[idx])
         
+        # Round all class percentages in one vectorized pass; float64 keeps .tolist() values clean
+        probs_pct = np.round(probs.astype(np.float64) * 100, 1).tolist()
+        
         # Get detailed information from knowledge base
         lesion_info = self.knowledge_base.get(diagnosis, {})
         
@@ -66,10 +191,11 @@ class SkinAnalysisService:
         if token:
             try:
                 api_service = get_doctormate_api_service(token)
-                specialty = await api_service.get_specialty(specialty_id) or {}
-                recommended_doctors = await api_service.get_recommended_doctors(specialty_id, limit=3)
-            except Exception as e:
-                print(f"Error fetching specialty/doctors: {str(e)}")
+                specialty, recommended_doctors = await api_service.get_specialty_and_doctors(
+                    specialty_id, limit=3
+                )
+            except Exception:
+                logger.exception("Error fetching specialty/doctors")
         
         return {
             "possible_diagnosis": lesion_info.get("name", "Unknown"),
@@ -86,10 +212,7 @@ class SkinAnalysisService:
                 "symptoms": lesion_info.get("symptoms", []),
                 "prognosis": lesion_info.get("prognosis", "Please consult a dermatologist for proper assessment."),
                 "treatment_options": lesion_info.get("treatment_options", []),
-                "all_probabilities": {
-                    self.CLASS_NAMES[i]: round(float(probs[i]) * 100, 1)
-                    for i in range(len(self.CLASS_NAMES))
-                }
+                "all_probabilities": dict(zip(self.CLASS_NAMES, probs_pct))
             },
             "disclaimer": "This is an AI-generated assessment and not a substitute for professional medical advice. Please consult a dermatologist for proper diagnosis and treatment."
         }
@@ -97,10 +220,19 @@ class SkinAnalysisService:
 
 # Singleton instance
 _skin_service = None
+_skin_service_lock = threading.Lock()
 
 def get_skin_service() -> SkinAnalysisService:
     """Get singleton instance of SkinAnalysisService."""
     global _skin_service
     if _skin_service is None:
-        _skin_service = SkinAnalysisService()
+        with _skin_service_lock:
+            if _skin_service is None:
+                _skin_service = SkinAnalysisService()
+    _skin_service.start_batcher()
     return _skin_service
+
+# Build the model at import time so `gunicorn --preload` loads it once in the master
+# process and workers share its weights copy-on-write (SKIP_MODEL_LOAD=1 defers this)
+if os.getenv("SKIP_MODEL_LOAD") != "1":
+    _skin_service = SkinAnalysisService()
@@ -2,14 +2,28 @@
 Service layer for symptom analysis using Gemini API.
 """
 import os
-import json
+import re
+import orjson
+import asyncio
+import logging
+import threading
+import httpx
 from google import genai
+from google.genai import types
 from typing import Dict
 from app.services.doctormate_api_service import (
     get_doctormate_api_service,
     SpecialtyMapper
 )
 
+logger = logging.getLogger(__name__)
+
+# Gemini connection pool size; sized for many concurrent symptom requests per worker
+GEMINI_MAX_CONNECTIONS = int(os.getenv("GEMINI_MAX_CONNECTIONS", "256"))
+
+# Matches the complete "possible_diagnosis" JSON string once its closing quote has streamed in
+_DIAGNOSIS_PATTERN = re.compile(r'"possible_diagnosis"\s*:\s*("(?:[^"\\]|\\.)*")')
+
 
 class SymptomsAnalysisService:
     """Service for analyzing symptoms using Gemini API."""
@@ -36,7 +50,33 @@ Base your analysis on common medical knowledge. Be cautious and recommend profes
         self.api_key = os.getenv("GEMINI_API_KEY")
         if not self.api_key:
             raise ValueError("GEMINI_API_KEY environment variable is not set.")
-        self.client = genai.Client(api_key=self.api_key)
+        # One client per service so its HTTP connection pool is reused across requests;
+        # the async pool is sized explicitly and keeps connections alive between calls
+        self.client = genai.Client(
+            api_key=self.api_key,
+            http_options=types.HttpOptions(
+                async_client_args={
+                    "limits": httpx.Limits(
+                        max_connections=GEMINI_MAX_CONNECTIONS,
+                        max_keepalive_connections=GEMINI_MAX_CONNECTIONS // 2,
+                        keepalive_expiry=30
+                    ),
+                    "http2": True
+                }
+            )
+        )
+        
+        # The system prompt goes in as a fixed system instruction (not interpolated into the
+        # user turn) so every request shares an identical prefix that Gemini can cache
+        self.generate_config = types.GenerateContentConfig(
+            system_instruction=self.SYSTEM_PROMPT,
+            response_mime_type='application/json',
+            temperature=0.3
+        )
+    
+    async def aclose(self) -> None:
+        """Close the Gemini client's pooled connections."""
+        await self.client.aio.aclose()
     
     async def analyze_symptoms(self, symptoms: str, token: str = None) -> Dict:
         """
@@ -53,15 +93,54 @@ Base your analysis on common medical knowledge. Be cautious and recommend profes
             Exception: If Gemini API call fails
         """
         try:
-            prompt = f"{self.SYSTEM_PROMPT}\n\nUser symptoms: {symptoms}"
-            
-            response = await self.client.aio.models.generate_content(
-                model='gemini-2.5-flash',
-                contents=prompt,
-                config={'response_mime_type': 'application/json', 'temperature': 0.3}
-            )
+            # Speculatively start the DoctorMate lookup from the symptoms alone so it
+            # overlaps with the Gemini call instead of following it
+            lookup_task = None
+            if token:
+                api_service = get_doctormate_api_service(token)
+                lookup_specialty_id = SpecialtyMapper.get_specialty_for_symptoms(symptoms, "")
+                lookup_task = asyncio.create_task(
+                    api_service.get_specialty_and_doctors(lookup_specialty_id, limit=3)
+                )
             
-            result = json.loads(response.text)
+            try:
+                chunks = []
+                streamed_diagnosis = None
+                stream = await self.client.aio.models.generate_content_stream(
+                    model='gemini-2.5-flash',
+                    contents=symptoms,
+                    config=self.generate_config
+                )
+                async for chunk in stream:
+                    text = chunk.text
+                    if not text:
+                        continue
+                    chunks.append(text)
+                    
+                    # As soon as the diagnosis is streamed, correct the lookup if the
+                    # mapping changes so it runs alongside the rest of the generation.
+                    # The diagnosis string can only complete in a chunk carrying its
+                    # closing quote, so other chunks skip re-joining the buffer.
+                    if token and streamed_diagnosis is None and '"' in text:
+                        match = _DIAGNOSIS_PATTERN.search("".join(chunks))
+                        if match:
+                            streamed_diagnosis = orjson.loads(match.group(1))
+                            specialty_id = SpecialtyMapper.get_specialty_for_symptoms(
+                                symptoms, streamed_diagnosis
+                            )
+                            if specialty_id != lookup_specialty_id:
+                                lookup_task.cancel()
+                                lookup_specialty_id = specialty_id
+                                lookup_task = asyncio.create_task(
+                                    api_service.get_specialty_and_doctors(specialty_id, limit=3)
+                                )
+                
+                # Parsed inside the guard so malformed model output also cancels the lookup
+                result = orjson.loads("".join(chunks))
+            except BaseException:
+                if lookup_task is not None:
+                    lookup_task.cancel()
+                raise
             
             # Get specialty and doctors from DoctorMate API if token provided
             specialty = {}
@@ -72,11 +151,16 @@ Base your analysis on common medical knowledge. Be cautious and recommend profes
                 specialty_id = SpecialtyMapper.get_specialty_for_symptoms(symptoms, diagnosis)
                 
                 try:
-                    api_service = get_doctormate_api_service(token)
-                    specialty = await api_service.get_specialty(specialty_id) or {}
-                    recommended_doctors = await api_service.get_recommended_doctors(specialty_id, limit=3)
-                except Exception as e:
-                    print(f"Error fetching specialty/doctors: {str(e)}")
+                    if specialty_id == lookup_specialty_id:
+                        specialty, recommended_doctors = await lookup_task
+                    else:
+                        # The diagnosis changed the mapping, so fetch the correct specialty
+                        lookup_task.cancel()
+                        specialty, recommended_doctors = await api_service.get_specialty_and_doctors(
+                            specialty_id, limit=3
+                        )
+                except Exception:
+                    logger.exception("Error fetching specialty/doctors")
             
             # Add specialty and doctors to result
             result["specialty"] = specialty
@@ -90,10 +174,21 @@ Base your analysis on common medical knowledge. Be cautious and recommend profes
 
 # Singleton instance
 _symptoms_service = None
+_symptoms_service_lock = threading.Lock()
 
 def get_symptoms_service() -> SymptomsAnalysisService:
     """Get singleton instance of SymptomsAnalysisService."""
     global _symptoms_service
     if _symptoms_service is None:
-        _symptoms_service = SymptomsAnalysisService()
+        with _symptoms_service_lock:
+            if _symptoms_service is None:
+                _symptoms_service = SymptomsAnalysisService()
     return _symptoms_service
+
+
+async def close_symptoms_service() -> None:
+    """Close the symptoms service client if it was created (called on application shutdown)."""
+    global _symptoms_service
+    if _symptoms_service is not None:
+        await _symptoms_service.aclose()
+        _symptoms_service = None
@@ -1,37 +1,170 @@
 """
 Utility functions for image preprocessing.
 """
+import asyncio
+import io
+import os
+
+# Upload limits: reject oversized files before reading them and oversized images
+# (decompression bombs) before decoding them
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(10 * 1024 * 1024)))
+MAX_IMAGE_PIXELS = int(os.getenv("MAX_IMAGE_PIXELS", "50000000"))
+
+# OpenCV reads its pixel limit from the environment, so set it before importing cv2
+os.environ.setdefault("OPENCV_IO_MAX_IMAGE_PIXELS", str(MAX_IMAGE_PIXELS))
+
+import cv2
 import numpy as np
 from PIL import Image
-from fastapi import UploadFile
-import io
+from fastapi import HTTPException, UploadFile
+from typing import BinaryIO, Optional
+
+# Lookup tables mapping each uint8 pixel value to its normalized value in [0, 1],
+# one per supported model input precision
+_NORMALIZE_LUTS = {
+    np.dtype(np.float32): np.arange(256, dtype=np.float32) / np.float32(255.0),
+    np.dtype(np.float16): (np.arange(256, dtype=np.float32) / np.float32(255.0)).astype(np.float16),
+}
 
 
-async def preprocess_image(file: UploadFile) -> np.ndarray:
+def aligned_empty(shape: tuple, dtype=np.float32, alignment: int = 64) -> np.ndarray:
+    """
+    Allocate an uninitialized C-contiguous array whose data starts on an aligned address.
+
+    Args:
+        shape: Array shape
+        dtype: Array dtype
+        alignment: Required byte alignment of the first element (64 = one cache line / AVX-512 vector)
+
+    Returns:
+        np.ndarray: Writable, C-contiguous, aligned array
+    """
+    dtype = np.dtype(dtype)
+    nbytes = int(np.prod(shape)) * dtype.itemsize
+    raw = np.empty(nbytes + alignment, dtype=np.uint8)
+    offset = -raw.ctypes.data % alignment
+    return raw[offset:offset + nbytes].view(dtype).reshape(shape)
+
+
+def _upload_too_large() -> HTTPException:
+    """Build the error returned for uploads over MAX_UPLOAD_BYTES."""
+    return HTTPException(
+        status_code=413,
+        detail=f"Image file is too large (maximum {MAX_UPLOAD_BYTES / (1024 * 1024):.1f} MB)"
+    )
+
+
+def _read_upload(upload: BinaryIO, size: Optional[int]) -> bytearray:
+    """Read a spooled upload file into one buffer preallocated to the upload size."""
+    upload.seek(0)
+    if size is None:
+        contents = bytearray(upload.read(MAX_UPLOAD_BYTES + 1))
+        if len(contents) > MAX_UPLOAD_BYTES:
+            raise _upload_too_large()
+        return contents
+
+    contents = bytearray(size)
+    read = upload.readinto(contents)
+    del contents[read:]
+    return contents
+
+
+def _axis_interpolation(length: int) -> int:
+    """Pick the interpolation for resizing one axis of the given length to 224."""
+    # INTER_AREA anti-aliases downscales but degrades to near-nearest-neighbour when
+    # upscaling, where bicubic matches the previous Pillow resize
+    return cv2.INTER_AREA if length >= 224 else cv2.INTER_CUBIC
+
+
+def _resize_to_input(pixels: np.ndarray) -> np.ndarray:
+    """Resize decoded pixels to 224x224, choosing the interpolation per axis."""
+    height, width = pixels.shape[:2]
+    x_interpolation = _axis_interpolation(width)
+    y_interpolation = _axis_interpolation(height)
+    if x_interpolation == y_interpolation:
+        return cv2.resize(pixels, (224, 224), interpolation=x_interpolation)
+
+    # One axis shrinks while the other grows, so resize each axis in its own pass
+    pixels = cv2.resize(pixels, (224, height), interpolation=x_interpolation)
+    return cv2.resize(pixels, (224, 224), interpolation=y_interpolation)
+
+
+def _image_too_large() -> HTTPException:
+    """Build the error returned for images over MAX_IMAGE_PIXELS."""
+    return HTTPException(status_code=413, detail="Image dimensions are too large")
+
+
+def _decode_with_opencv(contents: bytearray) -> Optional[np.ndarray]:
+    """Decode an image as 3-channel BGR with OpenCV, or return None if it can't decode it."""
+    # Ignore EXIF orientation like the previous Pillow decoder did
+    try:
+        return cv2.imdecode(
+            np.frombuffer(contents, dtype=np.uint8),
+            cv2.IMREAD_COLOR | cv2.IMREAD_IGNORE_ORIENTATION
+        )
+    except cv2.error as e:
+        # Raised after reading the header when it declares more than MAX_IMAGE_PIXELS
+        # (or OpenCV's per-side limit); any other decoder failure falls back to Pillow
+        if "CV_IO_MAX_IMAGE" in (e.err or ""):
+            raise _image_too_large()
+        return None
+
+
+def _decode_with_pillow(contents: bytearray) -> np.ndarray:
+    """Decode an image as 3-channel BGR with Pillow (fallback for formats OpenCV rejects)."""
+    try:
+        image = Image.open(io.BytesIO(contents))
+        # Image.open only reads the header, so check the size before decoding pixels
+        if image.width * image.height > MAX_IMAGE_PIXELS:
+            raise _image_too_large()
+        rgb = np.asarray(image.convert("RGB"))
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        raise ValueError("Could not decode image file") from e
+    return cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR)
+
+
+def _decode_and_prep(upload: BinaryIO, size: Optional[int], dtype: np.dtype) -> np.ndarray:
+    """Read, decode, resize and normalize an uploaded image (blocking, runs on a worker thread)."""
+    contents = _read_upload(upload, size)
+    if not contents:
+        raise ValueError("Could not decode image file")
+
+    pixels = _decode_with_opencv(contents)
+    if pixels is None:
+        # OpenCV lacks some formats the previous Pillow decoder read (e.g. GIF)
+        pixels = _decode_with_pillow(contents)
+
+    # Resize to model input size first so later passes only touch 224x224 pixels
+    pixels = _resize_to_input(pixels)
+
+    # Normalize with a table lookup (no per-pixel arithmetic) straight into an
+    # NHWC buffer (batch, height, width, channels) that the model expects.
+    # Reading channels in reverse turns BGR into RGB without a separate pass;
+    # mode='clip' avoids buffering `out`, and uint8 indices are always in range.
+    image_array = aligned_empty((1, 224, 224, 3), dtype=dtype)
+    np.take(_NORMALIZE_LUTS[dtype], pixels[..., ::-1], out=image_array[0], mode='clip')
+
+    return image_array
+
+
+async def preprocess_image(file: UploadFile, dtype=np.float32) -> np.ndarray:
     """
     Preprocess uploaded image for model inference.
-    
+
     Args:
         file: Uploaded image file
-        
+        dtype: Output precision, matching the model input (float32 or float16)
+
     Returns:
         np.ndarray: Preprocessed image array in NHWC format (batch, height, width, channels)
     """
-    # Read file contents
-    contents = await file.read()
-    
-    # Open and convert to RGB
-    image = Image.open(io.BytesIO(contents)).convert('RGB')
-    
-    # Resize to model input size
-    image = image.resize((224, 224))
-    
-    # Convert to numpy array and normalize
-    image_array = np.array(image, dtype=np.float32)
-    image_array = image_array / 255.0
-    
-    # Add batch dimension (model expects NHWC format: batch, height, width, channels)
-    image_array = np.expand_dims(image_array, axis=0)
-    
-    return image_array
+    dtype = np.dtype(dtype)
+    if dtype not in _NORMALIZE_LUTS:
+        raise ValueError(f"Unsupported image dtype: {dtype}")
+
+    # Fail fast on oversized uploads before any read or decode work
+    if file.size is not None and file.size > MAX_UPLOAD_BYTES:
+        raise _upload_too_large()
 
+    # Read and decode off the event loop so other requests keep being served
+    return await asyncio.to_thread(_decode_and_prep, file.file, file.size, dtype)
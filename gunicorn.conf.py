@@ -0,0 +1,14 @@
+"""
+Gunicorn configuration for production deployment.
+
+The app is preloaded in the master process, so the ONNX model is loaded once
+and its memory is shared copy-on-write by the forked Uvicorn workers.
+"""
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+# UvicornWorker picks uvloop and httptools automatically when they are installed
+worker_class = "uvicorn_worker.UvicornWorker"
+preload_app = True
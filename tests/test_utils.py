@@ -0,0 +1,70 @@
+"""
+Regression checks for image preprocessing against the previous Pillow pipeline.
+"""
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from app.utils import _decode_and_prep
+
+
+def _pattern_image(width: int, height: int, scale: float = 5.0, format: str = "PNG") -> bytes:
+    """Encode a synthetic RGB image (gradients plus a sinusoidal pattern of the given scale)."""
+    y, x = np.mgrid[0:height, 0:width]
+    pixels = np.stack([
+        x * 255 / (width - 1),
+        y * 255 / (height - 1),
+        (np.sin(x / scale) * np.cos(y / scale) + 1) * 127.5
+    ], axis=-1).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format=format)
+    return buffer.getvalue()
+
+
+def _pillow_reference(contents: bytes) -> np.ndarray:
+    """Preprocess an image the way the service did before switching to OpenCV."""
+    image = Image.open(io.BytesIO(contents)).convert("RGB").resize((224, 224))
+    return np.asarray(image, dtype=np.float32) / 255.0
+
+
+@pytest.mark.parametrize("width, height", [(50, 40), (60, 60), (120, 90)])
+def test_upscaled_image_matches_pillow(width, height):
+    contents = _pattern_image(width, height)
+
+    image_array = _decode_and_prep(io.BytesIO(contents), len(contents), np.dtype(np.float32))
+
+    assert image_array.shape == (1, 224, 224, 3)
+    diff = np.abs(image_array[0] - _pillow_reference(contents)) * 255
+    assert diff.mean() < 1.0
+    assert diff.max() <= 4.0
+
+
+@pytest.mark.parametrize("width, height", [(1000, 224), (2000, 150), (150, 2000), (224, 1000), (400, 300)])
+def test_downscaled_image_matches_pillow(width, height):
+    # Fine detail aliases visibly when an axis is shrunk without area averaging
+    contents = _pattern_image(width, height, scale=1.5)
+
+    image_array = _decode_and_prep(io.BytesIO(contents), len(contents), np.dtype(np.float32))
+
+    assert image_array.shape == (1, 224, 224, 3)
+    diff = np.abs(image_array[0] - _pillow_reference(contents)) * 255
+    assert diff.mean() < 3.0
+
+
+def test_gif_decodes_like_pillow():
+    # OpenCV cannot read GIF, so this goes through the Pillow fallback
+    contents = _pattern_image(120, 90, format="GIF")
+
+    image_array = _decode_and_prep(io.BytesIO(contents), len(contents), np.dtype(np.float32))
+
+    assert image_array.shape == (1, 224, 224, 3)
+    diff = np.abs(image_array[0] - _pillow_reference(contents)) * 255
+    assert diff.mean() < 1.0
+
+
+@pytest.mark.parametrize("contents", [b"", b"not an image"])
+def test_undecodable_upload_raises_value_error(contents):
+    with pytest.raises(ValueError, match="Could not decode image file"):
+        _decode_and_prep(io.BytesIO(contents), len(contents), np.dtype(np.float32))